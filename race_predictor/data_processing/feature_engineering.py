@@ -1,6 +1,26 @@
+import numpy as np
 import pandas as pd
+from typing import List, Union
 # 使用絕對導入
 from utils.logger import logger
+from data_processing.preprocessing import sort_by_race_order
+
+# 分段时间特征（均为马匹历史均值）
+SECTIONAL_FEATURES = ["马匹速度指数", "马匹早段步速", "马匹早段位置", "马匹后段追势", "马匹落后秒数", "马匹末段相对步速"]
+
+def grouped_prior_mean(df: pd.DataFrame, group_cols: Union[str, List[str]], value: Union[str, pd.Series]) -> pd.Series:
+    """
+    按组计算截至上一条记录的累计均值，等价于 groupby().transform(lambda x: x.shift(1).expanding().mean())，
+    但只用分组 cumsum 实现，复杂度随行数线性增长，没有逐组的 Python 调用。
+    "上一条" 指 df 中的行序，df 需已按 sort_by_race_order 排好。
+    """
+    values = pd.to_numeric(df[value] if isinstance(value, str) else value, errors="coerce")
+    keys = [df[c] for c in ([group_cols] if isinstance(group_cols, str) else group_cols)]
+    filled = values.fillna(0)
+    present = values.notna().astype(int)
+    prior_sum = filled.groupby(keys).cumsum() - filled
+    prior_count = present.groupby(keys).cumsum() - present
+    return prior_sum / prior_count.replace(0, np.nan)
 
 def calculate_recent_performance(df: pd.DataFrame, group_col: str, target_col: str, window: int = 5) -> pd.Series:
     """计算近期表现特征"""
@@ -10,9 +30,88 @@ def calculate_recent_performance(df: pd.DataFrame, group_col: str, target_col: s
 
 def calculate_distance_stats(df: pd.DataFrame, group_col: str, distance_col: str) -> pd.Series:
     """计算特定距离赛事表现"""
-    return df.groupby([group_col, distance_col])['是否第一'].transform(
-        lambda x: x.shift(1).expanding().mean()
-    )
+    return grouped_prior_mean(df, [group_col, distance_col], '是否第一')
+
+def first_section_length(distance: pd.Series) -> pd.Series:
+    """
+    首段长度（米）。HKJC 从终点往回每 400 米一段，余下的放在首段：
+    余数不足 200 米时并入首段（如 1650 米首段 450 米），整除时首段为 400 米。
+    """
+    remainder = distance % 400
+    return remainder.where(remainder >= 200, remainder + 400)
+
+def add_sectional_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    利用 parse_basic_info 解析的分段/累积时间计算步速特征，df 需已按 sort_by_race_order 排序。
+    赛事标准时间按 (馬場, 跑道类型, 距離, 場地狀況) 取此前赛事的均值，马匹特征取该马此前各场的均值，不含当场信息。
+    缺少所需列时对应特征为 NaN。
+    """
+    race_keys = [k for k in ['日期', '馬場', '場次'] if k in df.columns]
+    distance = pd.to_numeric(df['距離'].astype(str).str.extract(r'(\d+)')[0], errors='coerce') if '距離' in df.columns else pd.Series(np.nan, index=df.index)
+    going = df['場地狀況'].fillna('') if '場地狀況' in df.columns else pd.Series('', index=df.index)
+    venue = df['馬場'].fillna('') if '馬場' in df.columns else pd.Series('', index=df.index)
+    # 跑道类型：草地 / 全天候（解析不到賽道时为空，单独成组）
+    track = df['賽道'].fillna('').astype(str) if '賽道' in df.columns else pd.Series('', index=df.index)
+    surface = np.select([track.str.contains('全天候'), track.str.contains('草地')], ['全天候', '草地'], '')
+    race_time = df['全場時間_秒'] if '全場時間_秒' in df.columns else df.get('全場時間', pd.Series(np.nan, index=df.index))
+    race_time = pd.to_numeric(race_time, errors='coerce')
+    finish_time = pd.to_numeric(df.get('完成時間', pd.Series(np.nan, index=df.index)), errors='coerce')
+
+    # 累积时间 k 对应的距离：首段之后每段 400 米
+    cumulative = pd.DataFrame({
+        k: pd.to_numeric(df.get(f'累積時間{k}_秒', pd.Series(np.nan, index=df.index)), errors='coerce')
+        for k in range(1, 5)
+    })
+    first_len = first_section_length(distance)
+    cumulative_dist = pd.DataFrame({k: first_len + 400 * (k - 1) for k in range(1, 5)})
+
+    # 赛事层面
+    race_per_100m = race_time / distance * 100
+    # 早段：首个累积时间的每百米用时
+    early_per_100m = cumulative[1] / first_len * 100
+    # 末段：全场时间减去其之前最大的累积时间，除以该段实际长度，再与全场平均速度相比；>1 表示末段慢于平均（前段快）
+    before_finish = cumulative.where(cumulative < race_time.to_numpy()[:, None] - 1e-6)
+    last_k = before_finish.notna().to_numpy()[:, ::-1].argmax(axis=1)
+    last_k = np.where(before_finish.notna().any(axis=1), 4 - last_k, 0)
+    rows = np.arange(len(df))
+    last_cumulative = np.where(last_k > 0, before_finish.to_numpy()[rows, np.maximum(last_k - 1, 0)], np.nan)
+    last_dist = np.where(last_k > 0, cumulative_dist.to_numpy()[rows, np.maximum(last_k - 1, 0)], np.nan)
+    last_section_len = distance - last_dist
+    last_section_per_100m = (race_time - last_cumulative) / last_section_len.where(last_section_len > 0) * 100
+    last_split_ratio = last_section_per_100m / race_per_100m
+
+    # 标准时间只用此前赛事计算：每场取一行求累计均值，再广播回该场所有马匹
+    first_row = ~df.duplicated(subset=race_keys)
+    race_groups = [df[k] for k in race_keys]
+
+    def race_par(values: pd.Series) -> pd.Series:
+        races = pd.DataFrame({'馬場': venue, '跑道': surface, '距離米': distance, '場地狀況': going, 'value': values})[first_row]
+        par = grouped_prior_mean(races, ['馬場', '跑道', '距離米', '場地狀況'], 'value').reindex(df.index)
+        return par.groupby(race_groups).transform('first')
+
+    par = race_par(race_per_100m)
+    early_par = race_par(early_per_100m)
+
+    # 马匹层面
+    horse_per_100m = finish_time / distance * 100
+    field_size = df.groupby(race_keys)['馬匹編號'].transform('size')
+    running_positions = df['沿途走位'].astype(str).str.extract(r'(\d+)')[0] if '沿途走位' in df.columns else pd.Series(np.nan, index=df.index)
+    early_position = pd.to_numeric(running_positions, errors='coerce')
+    place = pd.to_numeric(df['名次'].astype(str).str.extract(r'(\d+)')[0], errors='coerce')
+
+    per_race = pd.DataFrame({
+        '马匹速度指数': par - horse_per_100m, # 正值表示快于同程同场地的标准时间
+        '马匹早段步速': early_par - early_per_100m, # 该马所跑赛事首段快于标准的程度
+        '马匹早段位置': early_position / field_size, # 越小越靠前，反映前段速度
+        '马匹后段追势': (early_position - place) / field_size, # 正值表示后段追前
+        '马匹落后秒数': (finish_time - race_time) / distance * 100, # 每百米落后头马的秒数
+        '马匹末段相对步速': last_split_ratio, # 该马所跑赛事的步速形态
+    })
+    for col in SECTIONAL_FEATURES:
+        df[col] = grouped_prior_mean(df, '馬匹編號', per_race[col])
+
+    logger.info("分段时间步速特征添加完成。")
+    return df
 
 def add_historical_features(df: pd.DataFrame) -> pd.DataFrame:
     """添加历史数据特征"""
@@ -20,27 +119,30 @@ def add_historical_features(df: pd.DataFrame) -> pd.DataFrame:
         logger.warning("输入数据为空，返回空 DataFrame。")
         return df
 
-    # 确保数据已按日期和场次排序 
-    df = df.sort_values(by=['日期', '場次']).reset_index(drop=True)
+    # 确保数据已按日期和场次排序（按解析后的日期，而不是 dd/mm/yyyy 字符串）
+    df = sort_by_race_order(df)
 
     # 基础历史特征
     df['马匹参赛次数'] = df.groupby('馬匹編號').cumcount()
-    df['马匹胜率'] = df.groupby('馬匹編號')['是否第一'].transform(lambda x: x.shift(1).expanding().mean())
-    df['平均完成时间'] = df.groupby('馬匹編號')['完成時間'].transform(lambda x: x.shift(1).expanding().mean())
-    df['平均赔率'] = df.groupby('馬匹編號')['獨贏賠率'].transform(lambda x: x.shift(1).expanding().mean())
+    df['马匹胜率'] = grouped_prior_mean(df, '馬匹編號', '是否第一')
+    df['平均完成时间'] = grouped_prior_mean(df, '馬匹編號', '完成時間')
+    df['平均赔率'] = grouped_prior_mean(df, '馬匹編號', '獨贏賠率')
     
     # 新增特征
     df['马匹近期表现'] = calculate_recent_performance(df, '馬匹編號', '名次')
     df['骑师距离胜率'] = calculate_distance_stats(df, '騎師', '距離')
     df['练马师距离胜率'] = calculate_distance_stats(df, '練馬師', '距離')
 
+    # 分段时间步速特征
+    df = add_sectional_features(df)
+
     # 骑师历史表现
     df['骑师参赛次数'] = df.groupby('騎師').cumcount()
-    df['骑师胜率'] = df.groupby('騎師')['是否第一'].transform(lambda x: x.shift(1).expanding().mean())
+    df['骑师胜率'] = grouped_prior_mean(df, '騎師', '是否第一')
 
     # 练马师历史表现
     df['练马师参赛次数'] = df.groupby('練馬師').cumcount()
-    df['练马师胜率'] = df.groupby('練馬師')['是否第一'].transform(lambda x: x.shift(1).expanding().mean())
+    df['练马师胜率'] = grouped_prior_mean(df, '練馬師', '是否第一')
 
     # 填充首次出现（shift(1) 导致第一行为 NaN）以及没有历史记录的情况
     # 对于胜率，首次参赛填充 0
@@ -52,6 +154,9 @@ def add_historical_features(df: pd.DataFrame) -> pd.DataFrame:
     # 这里我们先用 0 填充，表示无历史记录，后续模型训练时可能需要进一步处理或选择不同填充策略
     df["平均完成时间"] = df["平均完成时间"].fillna(df["平均完成时间"].median()) # 使用中位数填充 NaN
     df["平均赔率"] = df["平均赔率"].fillna(df["平均赔率"].median()) # 使用中位数填充 NaN
+    # 分段时间特征同样用中位数填充首次参赛的马匹：0 对末段相对步速（约 1）、早段位置（0 为每场领放）等是极端值，而非"未知"
+    for col in SECTIONAL_FEATURES:
+        df[col] = df[col].fillna(df[col].median())
     
     # 删除辅助列（如果不需要）
     # df = df.drop(columns=['马匹参赛次数', '骑师参赛次数', '练马师参赛次数'])
@@ -2,6 +2,7 @@ import pandas as pd
 import re
 # 使用絕對導入
 from utils.logger import logger
+from utils.metrics import metrics
 
 def fix_time_format(t):
     if pd.isna(t):
@@ -11,16 +12,30 @@ def fix_time_format(t):
         return "0:" + t
     return t if re.match(r"^\d+:\d{2}:\d{2}\.\d{2}$", t) else None
 
+def _race_order_key(col: pd.Series) -> pd.Series:
+    # 日期按 dd/mm/yyyy 解析后比较，場次按数字比较，避免字符串排序把 26/02 排在 09/03 之后
+    if col.name == '日期':
+        return pd.to_datetime(col, format='%d/%m/%Y', errors='coerce')
+    if col.name == '場次':
+        return pd.to_numeric(col, errors='coerce')
+    return col
+
+def sort_by_race_order(df: pd.DataFrame) -> pd.DataFrame:
+    """按实际日期和场次排序（稳定排序），历史特征的累计计算依赖这一顺序"""
+    return df.sort_values(by=['日期', '場次'], key=_race_order_key, kind='stable').reset_index(drop=True)
+
 def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
     logger.info("数据预处理开始。")
     
     # 首先按日期和场次排序，确保历史数据顺序正确
     if '日期' in df.columns and '場次' in df.columns:
-        df = df.sort_values(by=['日期', '場次']).reset_index(drop=True)
+        df = sort_by_race_order(df)
 
     # 去除空值或缺失列（保留必要的历史数据列）
     required_cols = ["馬名", "場次", "排位體重", "檔位", "獨贏賠率", "名次", "完成時間"]
+    rows_before = len(df)
     df = df.dropna(subset=required_cols)
+    metrics.incr("preprocess_rows_dropped_missing_required", rows_before - len(df))
 
     # 清洗數值類欄位
     numeric_columns = ["實際負磅", "排位體重", "檔位", "獨贏賠率"]
@@ -62,7 +77,9 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
     df["完成時間"] = pd.to_timedelta(df["完成時間"], errors="coerce").dt.total_seconds()
 
     # 排除沒有完成時間或平均走位的數據
+    rows_before = len(df)
     df = df.dropna(subset=["完成時間", "平均走位"])
+    metrics.incr("preprocess_rows_dropped_invalid_time", rows_before - len(df))
 
     # 計算全場時間（第一名馬匹的完成時間）
     df["全場時間"] = df.groupby("場次")["完成時間"].transform(
@@ -70,7 +87,9 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     # 排除沒有全場時間的場次
+    rows_before = len(df)
     df = df.dropna(subset=["全場時間"])
+    metrics.incr("preprocess_rows_dropped_no_race_time", rows_before - len(df))
 
     logger.info("数据预处理完成。")
     return df
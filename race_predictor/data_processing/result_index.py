@@ -0,0 +1,139 @@
+import os
+import json
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+# 使用絕對導入
+from utils.logger import logger
+
+# 赛果主键：同一匹马在同一赛事只能出现一次
+KEY_COLUMNS = ["日期", "馬場", "場次", "馬匹編號"]
+
+def _normalise_dates(dates: pd.Series) -> pd.Series:
+    """日期统一为补零的 dd/mm/yyyy（如 2/3/2025 -> 02/03/2025），无法解析的保持原样"""
+    dates = dates.astype(str).str.strip()
+    parsed = pd.to_datetime(dates, format="%d/%m/%Y", errors="coerce")
+    return parsed.dt.strftime("%d/%m/%Y").fillna(dates)
+
+def _meeting_name(date: str, venue: str) -> str:
+    """赛马日在索引中的名称 '日期|馬場'，与 ingest 登记时的格式一致"""
+    return f"{_normalise_dates(pd.Series([date])).iloc[0]}|{str(venue).strip()}"
+
+def _normalise_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """统一主键列格式（日期 dd/mm/yyyy、場次去掉小数点等），保证同一赛事得到同一个键"""
+    keys = df[KEY_COLUMNS].astype(str).apply(lambda col: col.str.strip())
+    keys["日期"] = _normalise_dates(keys["日期"])
+    keys["場次"] = pd.to_numeric(keys["場次"], errors="coerce").astype("Int64").astype(str)
+    return keys
+
+def result_keys(df: pd.DataFrame) -> pd.Series:
+    """每行的主键字符串 '日期|馬場|場次|馬匹編號'"""
+    keys = _normalise_keys(df)
+    return keys[KEY_COLUMNS[0]].str.cat([keys[c] for c in KEY_COLUMNS[1:]], sep="|")
+
+def drop_duplicate_results(df: pd.DataFrame) -> pd.DataFrame:
+    """同一主键出现多次时只保留最后一条（最新抓取的赛果）"""
+    return df[~result_keys(df).duplicated(keep="last")]
+
+def row_hashes(df: pd.DataFrame) -> pd.Series:
+    """每行内容的哈希，用于判断已存在的赛果是否被更正"""
+    return pd.util.hash_pandas_object(df.astype(str), index=False).astype(str)
+
+class ResultIndex:
+    """
+    与数据集一起保存的赛果主键索引（JSON）：
+      rows: 主键 -> 行内容哈希，O(1) 判断重复与更正；
+      meetings: '日期|馬場' -> 已有场次列表，校验缺场只需读取索引，不扫描历史数据。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows: Dict[str, str] = {}
+        self.meetings: Dict[str, List[int]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.rows = data.get("rows", {})
+            self.meetings = data.get("meetings", {})
+
+    @classmethod
+    def for_dataset(cls, dataset_path: str) -> "ResultIndex":
+        """
+        数据集 data/x.csv 对应的索引文件为 data/x.index.json。
+        数据集不存在时忽略残留的索引，从空索引开始，保证索引与数据集一致。
+        """
+        index = cls(os.path.splitext(dataset_path)[0] + ".index.json")
+        if not os.path.exists(dataset_path) and index.rows:
+            logger.warning(f"数据集 {dataset_path} 不存在，忽略旧索引。")
+            index.rows, index.meetings = {}, {}
+        return index
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"rows": self.rows, "meetings": self.meetings}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def ingest(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        登记一批赛果并返回需要写入的行（新增或内容有更正的），同批内重复的主键只保留最后一条。
+        已存在且内容未变的行被丢弃。
+        """
+        if df.empty:
+            return df
+        df = drop_duplicate_results(df)
+        keys = result_keys(df)
+        hashes = row_hashes(df)
+
+        existing = keys.map(self.rows)
+        is_new = existing.isna()
+        is_updated = ~is_new & (existing != hashes)
+        self.rows.update(zip(keys, hashes))
+
+        norm = _normalise_keys(df)
+        for meeting, races in norm.groupby(norm["日期"] + "|" + norm["馬場"])["場次"]:
+            known = set(self.meetings.get(meeting, []))
+            known.update(int(r) for r in races.unique() if r.isdigit())
+            self.meetings[meeting] = sorted(known)
+
+        logger.info(f"赛果索引：新增 {int(is_new.sum())} 行，更正 {int(is_updated.sum())} 行，"
+                    f"重复未变 {int((~is_new & ~is_updated).sum())} 行。")
+        return df[is_new | is_updated]
+
+    def verify(self, meetings: Optional[List[Tuple[str, str]]] = None, expected_races: Optional[Dict[str, int]] = None) -> Dict[str, List[int]]:
+        """
+        返回各赛马日缺失的场次。默认检查 1 到已有最大场次之间的空缺；
+        expected_races 可按 '日期|馬場' 指定当日实际场数，以发现末尾缺场。
+        meetings 为 [(日期, 馬場)]，不传则检查索引中所有赛马日；日期格式与 ingest 一样做统一。
+        索引中完全没有的赛马日视为整日缺失：有 expected_races 时返回全部场次，否则返回空列表。
+        """
+        names = [_meeting_name(d, v) for d, v in meetings] if meetings is not None else list(self.meetings)
+        expected_races = {_meeting_name(*name.split("|", 1)): n for name, n in (expected_races or {}).items()}
+        gaps = {}
+        for name in names:
+            if name not in self.meetings:
+                gaps[name] = list(range(1, expected_races.get(name, 0) + 1))
+                logger.warning(f"{name} 未收录任何赛果。")
+                continue
+            races = set(self.meetings[name])
+            last = expected_races.get(name, max(races, default=0))
+            missing = sorted(set(range(1, last + 1)) - races)
+            if missing:
+                gaps[name] = missing
+                logger.warning(f"{name} 缺少场次: {missing}")
+        return gaps
+
+def upsert_results(existing: pd.DataFrame, updates: pd.DataFrame) -> pd.DataFrame:
+    """按主键合并：updates 中的行覆盖 existing 中同主键的行，其余保留"""
+    if existing.empty:
+        return updates.reset_index(drop=True)
+    if updates.empty:
+        return existing
+    combined = pd.concat([existing, updates], ignore_index=True)
+    return drop_duplicate_results(combined).reset_index(drop=True)
@@ -1,5 +1,6 @@
 import os
 import pickle
+from typing import Optional
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
@@ -8,8 +9,24 @@ from lightgbm import LGBMClassifier
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.metrics import accuracy_score
 from utils.logger import logger
+from data_processing.feature_engineering import SECTIONAL_FEATURES
 import numpy as np
 
+# 模型使用的特征（训练与预测共用）
+FEATURES = [
+    "實際負磅", "排位體重", "檔位", "平均走位", "獨贏賠率",
+    "马匹胜率", "平均完成时间", "平均赔率", "骑师胜率", "练马师胜率",
+    "马匹近期表现", "骑师距离胜率", "练马师距离胜率"
+] + SECTIONAL_FEATURES
+
+def model_features(model) -> list:
+    """
+    模型训练时使用的特征列表。sklearn / XGBoost / LightGBM 在用 DataFrame 训练后会记录 feature_names_in_，
+    据此选列即可继续使用特征集变更前训练的旧模型；没有记录时使用当前的 FEATURES。
+    """
+    names = getattr(model, "feature_names_in_", None)
+    return list(names) if names is not None else list(FEATURES)
+
 def train_xgboost(X_train, y_train):
     """训练XGBoost模型"""
     params = {
@@ -64,13 +81,9 @@ def model_comparison(X_train, y_train, X_test, y_test):
     
     return results
 
-def train_model(df: pd.DataFrame) -> dict:
-    """训练并比较多个模型，返回最佳模型和比较结果"""
-    features = [
-        "實際負磅", "排位體重", "檔位", "平均走位", "獨贏賠率",
-        "马匹胜率", "平均完成时间", "平均赔率", "骑师胜率", "练马师胜率",
-        "马匹近期表现", "骑师距离胜率", "练马师距离胜率"
-    ]
+def train_model(df: pd.DataFrame, model_path: Optional[str] = "models/best_model.pkl") -> dict:
+    """训练并比较多个模型，返回最佳模型和比较结果。model_path 为 None 时不保存（用于候选模型）"""
+    features = FEATURES
     
     # 检查特征是否存在
     missing_features = [f for f in features if f not in df.columns]
@@ -114,10 +127,11 @@ def train_model(df: pd.DataFrame) -> dict:
         logger.info(f"{name} 模型测试准确率: {acc:.4f}")
     
     # 保存最佳模型
-    os.makedirs("models", exist_ok=True)
-    with open("models/best_model.pkl", "wb") as f:
-        pickle.dump(best_model, f)
-    logger.info(f"最佳模型已保存 (准确率: {best_acc:.4f})")
+    if model_path:
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        with open(model_path, "wb") as f:
+            pickle.dump(best_model, f)
+        logger.info(f"最佳模型已保存 (准确率: {best_acc:.4f})")
     
     return {
         "best_model": best_model,
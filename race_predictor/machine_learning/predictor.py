@@ -5,15 +5,13 @@ import pickle
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from utils.logger import logger
+from machine_learning.model import model_features
+from data_processing.feature_engineering import SECTIONAL_FEATURES
 import numpy as np # Import numpy
 
 def predict_winner(race: pd.DataFrame, model) -> pd.DataFrame:
     """预测比赛结果，返回包含预测概率的DataFrame"""
-    features = [
-        "實際負磅", "排位體重", "檔位", "平均走位", "獨贏賠率",
-        "马匹胜率", "平均完成时间", "平均赔率", "骑师胜率", "练马师胜率",
-        "马匹近期表现", "骑师距离胜率", "练马师距离胜率"
-    ]
+    features = model_features(model) # 旧模型按其训练时的特征选列
     logger.debug(f"模型預期特徵: {features}")
     logger.debug(f"輸入 DataFrame 欄位: {race.columns.tolist()}")
     
@@ -30,6 +28,9 @@ def predict_winner(race: pd.DataFrame, model) -> pd.DataFrame:
         if "平均赔率" in missing_features: fill_values["平均赔率"] = model.feature_importances_[features.index("平均赔率")] # Placeholder, ideally use training mean
         if "骑师胜率" in missing_features: fill_values["骑师胜率"] = 0
         if "练马师胜率" in missing_features: fill_values["练马师胜率"] = 0
+        # 分段时间特征整列缺失说明数据没有经过 add_historical_features（那里首次参赛按中位数填充），
+        # 这里没有训练数据的中位数可用，只能按 0 兜底，预测结果会偏离训练分布
+        fill_values.update({f: 0 for f in SECTIONAL_FEATURES if f in missing_features})
         
         logger.warning(f"預測數據缺少特徵: {missing_features}. 嘗試填充: {fill_values}")
         for feature, value in fill_values.items():
@@ -45,7 +46,7 @@ def predict_winner(race: pd.DataFrame, model) -> pd.DataFrame:
     
     # Handle potential infinite values and NaNs in prediction data as well
     X_new.replace([np.inf, -np.inf], np.nan, inplace=True)
-    X_new.fillna(0, inplace=True) # Fill NaNs with 0, consistent with training
+    X_new.fillna(0, inplace=True) # 剩余 NaN 按 0 填充，与 train_model 一致（分段时间特征已在 add_historical_features 中按中位数填充）
 
     # Ensure column order matches the order during training (important for some models)
     # Although RandomForest is generally robust to order, it's good practice.
@@ -0,0 +1,141 @@
+import os
+import pickle
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize_scalar
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GroupShuffleSplit
+from lightgbm import LGBMRanker
+from utils.logger import logger
+from machine_learning.model import FEATURES, model_features
+
+# 唯一确定一场赛事的列
+RACE_KEYS = ["日期", "馬場", "場次"]
+
+def race_ids(df: pd.DataFrame) -> np.ndarray:
+    """为每行生成所属赛事的整数编号"""
+    keys = [k for k in RACE_KEYS if k in df.columns]
+    return df.groupby(keys, sort=False).ngroup().to_numpy()
+
+def finishing_place(df: pd.DataFrame) -> pd.Series:
+    """从名次列提取数字名次（如 '3 平頭馬' -> 3），无法解析的为 NaN"""
+    return pd.to_numeric(df["名次"].astype(str).str.extract(r"(\d+)")[0], errors="coerce")
+
+def prepare_features(df: pd.DataFrame, features: List[str] = FEATURES) -> pd.DataFrame:
+    """取出特征并做与训练一致的清洗"""
+    missing_features = [f for f in features if f not in df.columns]
+    if missing_features:
+        raise ValueError(f"缺少必要特征: {missing_features}")
+    X = df[features].copy()
+    X.replace([np.inf, -np.inf], np.nan, inplace=True)
+    X.fillna(0, inplace=True)
+    return X
+
+def race_softmax(scores: np.ndarray, groups: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    """按赛事做 softmax（条件 logit），同场概率和为 1。全程向量化，不逐场循环。"""
+    z = pd.Series(np.asarray(scores, dtype=float) / temperature)
+    z = z - z.groupby(groups).transform("max")
+    e = np.exp(z)
+    return (e / e.groupby(groups).transform("sum")).to_numpy()
+
+def fit_temperature(scores: np.ndarray, groups: np.ndarray, winners: np.ndarray) -> float:
+    """以各场头马的条件对数似然最大为目标，拟合 softmax 温度（一次性校准）"""
+    has_winner = pd.Series(winners).groupby(groups).transform("sum").to_numpy() > 0
+    scores, groups, winners = scores[has_winner], groups[has_winner], winners[has_winner]
+    if not winners.any():
+        logger.warning("校准数据中没有头马，温度使用默认值 1.0。")
+        return 1.0
+
+    def neg_log_likelihood(log_t):
+        probs = race_softmax(scores, groups, np.exp(log_t))
+        return -np.log(np.clip(probs[winners == 1], 1e-12, None)).sum()
+
+    res = minimize_scalar(neg_log_likelihood, bounds=(-5, 5), method="bounded")
+    return float(np.exp(res.x))
+
+class RaceRanker:
+    """
+    赛事内归一化的排名模型：底层模型输出得分，经拟合的温度做按场 softmax，
+    得到同场和为 1、可直接与獨贏賠率比较的胜出概率。
+    """
+
+    def __init__(self, model, method: str, temperature: float = 1.0, features: Optional[List[str]] = None):
+        self.model = model
+        self.method = method
+        self.temperature = temperature
+        # 记录底层模型训练时的特征，特征集变更后旧模型仍按原特征打分
+        self.features = features or model_features(model)
+
+    def raw_scores(self, X: pd.DataFrame) -> np.ndarray:
+        if self.method == "lambdarank":
+            return self.model.predict(X)
+        # 条件 logit：把二分类概率还原为 logit 得分
+        p = np.clip(self.model.predict_proba(X)[:, 1], 1e-9, 1 - 1e-9)
+        return np.log(p / (1 - p))
+
+    def score_meeting(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        一次性为整个赛马日（可含多场）打分，返回带预测概率、市场隐含概率与期望值的 DataFrame，
+        按场次、预测概率降序排列。
+        """
+        if df.empty:
+            return df
+        result = df.copy()
+        groups = race_ids(result)
+        scores = self.raw_scores(prepare_features(result, self.features))
+        result["预测概率"] = race_softmax(scores, groups, self.temperature)
+
+        # 獨贏賠率换算的市场隐含概率（去除抽水后按场归一）
+        odds = pd.to_numeric(result["獨贏賠率"], errors="coerce")
+        implied = (1 / odds).where(odds > 0)
+        result["隐含概率"] = implied / implied.groupby(groups).transform("sum")
+        result["期望值"] = result["预测概率"] * odds - 1
+
+        sort_keys = [k for k in RACE_KEYS if k in result.columns] + ["预测概率"]
+        ascending = [True] * (len(sort_keys) - 1) + [False]
+        return result.sort_values(sort_keys, ascending=ascending).reset_index(drop=True)
+
+def train_ranker(df: pd.DataFrame, method: str = "conditional_logit", base_model=None,
+                 calibration_size: float = 0.2, model_path: Optional[str] = "models/ranker.pkl") -> RaceRanker:
+    """
+    训练排名模型。
+    method="conditional_logit"：以 base_model（如 train_model 的最佳模型）的同款参数或逻辑回归的得分做按场 softmax；
+    method="lambdarank"：以 LightGBM lambdarank 按场分组训练。
+    底层模型只在按场划分的训练部分上（重新）拟合，温度只在其未见过的留出赛事上拟合一次，避免样本内校准过度自信。
+    """
+    if method not in ("conditional_logit", "lambdarank"):
+        raise ValueError(f"不支持的排名方法: {method}")
+
+    keys = [k for k in RACE_KEYS if k in df.columns]
+    df = df.sort_values(keys, kind="stable").reset_index(drop=True)
+    X = prepare_features(df)
+    y = df["是否第一"].to_numpy()
+    groups = race_ids(df)
+
+    splitter = GroupShuffleSplit(n_splits=1, test_size=calibration_size, random_state=42)
+    train_idx, calib_idx = next(splitter.split(X, y, groups))
+    if method == "lambdarank":
+        place = finishing_place(df)
+        # 相关度：头马 3，亚军 2，季军 1，其余 0
+        relevance = (4 - place).clip(lower=0, upper=3).fillna(0).astype(int).to_numpy()
+        group_sizes = np.unique(groups[train_idx], return_counts=True)[1]
+        model = LGBMRanker(objective="lambdarank", random_state=42)
+        model.fit(X.iloc[train_idx], relevance[train_idx], group=group_sizes)
+    else:
+        # base_model 已见过全部数据，按其参数在训练部分重新拟合，留出赛事对它保持未见
+        model = clone(base_model) if base_model is not None else LogisticRegression(random_state=42, max_iter=1000)
+        model.fit(X.iloc[train_idx], y[train_idx])
+    ranker = RaceRanker(model, method)
+
+    calib_scores = ranker.raw_scores(X.iloc[calib_idx])
+    ranker.temperature = fit_temperature(calib_scores, groups[calib_idx], y[calib_idx])
+    logger.info(f"排名模型 ({method}) 训练完成，校准温度: {ranker.temperature:.4f}")
+
+    if model_path:
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        with open(model_path, "wb") as f:
+            pickle.dump(ranker, f)
+        logger.info(f"排名模型已保存到 {model_path}")
+    return ranker
@@ -0,0 +1,86 @@
+import os
+import json
+import pickle
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from utils.logger import logger
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """先写临时文件再 os.replace，读取方不会看到写了一半的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class ModelRegistry:
+    """
+    基于本地目录的模型仓库：
+      <root>/<版本>/model.pkl、meta.json 保存每个注册的模型；
+      <root>/CURRENT 记录当前生效的版本。
+    晋升时同时原子替换 best_model_path，兼容直接读取 models/best_model.pkl 的旧流程。
+    """
+
+    def __init__(self, root: str = "models/registry", best_model_path: str = "models/best_model.pkl"):
+        self.root = root
+        self.best_model_path = best_model_path
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def register(self, model, metrics: Dict, trained_until: Optional[str] = None) -> str:
+        """
+        保存模型及其评估指标，返回版本号（不改变当前版本）。
+        trained_until 为训练数据的最后日期（dd/mm/yyyy），重训时只用此后的赛马日评估该模型。
+        """
+        version = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        version_dir = os.path.join(self.root, version)
+        os.makedirs(version_dir)
+        with open(os.path.join(version_dir, "model.pkl"), "wb") as f:
+            pickle.dump(model, f)
+        with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": version, "metrics": metrics, "trained_until": trained_until}, f, ensure_ascii=False)
+        logger.info(f"模型已注册为版本 {version}")
+        return version
+
+    def current_version(self) -> Optional[str]:
+        path = os.path.join(self.root, "CURRENT")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+
+    def metadata(self, version: Optional[str] = None) -> Dict:
+        """读取指定版本（默认当前版本）的 meta.json；没有注册版本时返回空字典"""
+        version = version or self.current_version()
+        if version is None:
+            return {}
+        path = os.path.join(self.root, version, "meta.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, version: Optional[str] = None):
+        """加载指定版本（默认当前版本）；仓库为空时回退到 best_model_path"""
+        version = version or self.current_version()
+        if version is None:
+            if not os.path.exists(self.best_model_path):
+                return None
+            path = self.best_model_path
+        else:
+            path = os.path.join(self.root, version, "model.pkl")
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def promote(self, version: str) -> None:
+        """把指定版本设为当前版本，并原子替换 best_model_path"""
+        model_file = os.path.join(self.root, version, "model.pkl")
+        if not os.path.exists(model_file):
+            raise ValueError(f"模型版本不存在: {version}")
+        with self._lock:
+            with open(model_file, "rb") as f:
+                data = f.read()
+            os.makedirs(os.path.dirname(self.best_model_path) or ".", exist_ok=True)
+            _atomic_write(self.best_model_path, data)
+            _atomic_write(os.path.join(self.root, "CURRENT"), version.encode("utf-8"))
+        logger.info(f"模型版本 {version} 已晋升为当前模型。")
@@ -0,0 +1,144 @@
+import queue
+import threading
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from utils.logger import logger
+from machine_learning.model import train_model
+from machine_learning.ranking import RaceRanker, race_ids, race_softmax, prepare_features, train_ranker
+from machine_learning.registry import ModelRegistry
+
+def winner_log_likelihood(ranker: Optional[RaceRanker], df: pd.DataFrame) -> float:
+    """
+    留出赛事中头马的平均对数预测概率（按场 softmax 后的 预测概率），越大越好。
+    与排名模型的校准目标一致，比每场只看首选是否命中的命中率稳定得多。
+    """
+    if ranker is None or df.empty:
+        return -np.inf
+    groups = race_ids(df)
+    scores = ranker.raw_scores(prepare_features(df, ranker.features))
+    probs = race_softmax(scores, groups, ranker.temperature)
+    winners = df["是否第一"].to_numpy() == 1
+    if not winners.any():
+        return -np.inf
+    return float(np.log(np.clip(probs[winners], 1e-12, None)).mean())
+
+def train_candidate(df: pd.DataFrame) -> RaceRanker:
+    """重训底层模型并重新拟合按场校准，得到可直接上线的候选排名模型（不写入 models/）"""
+    best_model = train_model(df, model_path=None)["best_model"]
+    return train_ranker(df, base_model=best_model, model_path=None)
+
+class HotSwapPredictor:
+    """
+    持有当前排名模型并提供预测。swap() 只替换模型引用，
+    正在进行的预测继续使用旧模型完成，不会中断或丢弃请求。
+    """
+
+    def __init__(self, ranker: Optional[RaceRanker]):
+        self._ranker = ranker
+        self._lock = threading.Lock()
+
+    @property
+    def ranker(self) -> Optional[RaceRanker]:
+        with self._lock:
+            return self._ranker
+
+    def swap(self, ranker: RaceRanker) -> None:
+        with self._lock:
+            self._ranker = ranker
+        logger.info("预测服务已切换到新模型。")
+
+    def score_meeting(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.ranker.score_meeting(df)
+
+class RetrainScheduler:
+    """
+    后台重训调度器：每导入一个新赛马日调用 notify_race_day_ingested()，
+    工作线程以当前模型训练数据之后、最近 holdout_days 个赛马日作为留出集训练候选排名模型（底层模型 + 校准），
+    头马对数似然优于当前模型时注册并晋升，同时热切换 predictor 的模型。
+    """
+
+    def __init__(self, predictor: HotSwapPredictor, registry: Optional[ModelRegistry] = None,
+                 holdout_days: int = 1, trainer: Optional[Callable[[pd.DataFrame], RaceRanker]] = None):
+        self.predictor = predictor
+        self.registry = registry or ModelRegistry(best_model_path="models/ranker.pkl")
+        self.holdout_days = holdout_days
+        self.trainer = trainer or train_candidate
+        self._jobs: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="RetrainScheduler", daemon=True)
+
+    def start(self) -> "RetrainScheduler":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """处理完已排队的任务后停止工作线程"""
+        self._jobs.put(None)
+        self._thread.join(timeout)
+
+    def notify_race_day_ingested(self, df: pd.DataFrame) -> None:
+        """提交包含新赛马日在内的完整特征数据，立即返回，不阻塞预测"""
+        self._jobs.put(df)
+
+    def _next_job(self, df):
+        # 训练期间积压的多个赛马日只需用最新的数据重训一次
+        while True:
+            try:
+                newer = self._jobs.get_nowait()
+            except queue.Empty:
+                return df
+            if newer is None:
+                self._jobs.put(None)
+                return df
+            df = newer
+
+    def _run(self) -> None:
+        while True:
+            df = self._jobs.get()
+            if df is None:
+                return
+            try:
+                self.retrain(self._next_job(df))
+            except Exception as e:
+                logger.error(f"后台重训失败: {e}")
+
+    def retrain(self, df: pd.DataFrame) -> bool:
+        """训练并评估候选模型，胜出时晋升并热切换，返回是否晋升"""
+        dates = pd.to_datetime(df["日期"], format="%d/%m/%Y")
+        # 留出集只取当前模型没有训练过的赛马日，否则当前模型是在样本内与候选模型比较
+        trained_until = self.registry.metadata().get("trained_until")
+        candidate_dates = dates
+        if trained_until:
+            candidate_dates = dates[dates > pd.to_datetime(trained_until, format="%d/%m/%Y")]
+        elif self.predictor.ranker is not None:
+            logger.warning("当前模型没有记录训练数据截止日期，留出集可能包含其训练数据。")
+        holdout_dates = np.sort(candidate_dates.unique())[-self.holdout_days:]
+        is_holdout = dates.isin(holdout_dates).to_numpy()
+        train_df, holdout_df = df[~is_holdout], df[is_holdout]
+        if train_df.empty or holdout_df.empty:
+            logger.warning("没有当前模型未见过的赛马日，或数据不足以划分训练集与留出集，跳过本次重训。")
+            return False
+
+        logger.info(f"后台重训开始：训练 {len(train_df)} 行，留出 {len(holdout_df)} 行。")
+        candidate = self.trainer(train_df)
+        candidate_score = winner_log_likelihood(candidate, holdout_df)
+        current = self.predictor.ranker
+        try:
+            current_score = winner_log_likelihood(current, holdout_df)
+        except Exception as e:
+            # 当前模型无法对新数据打分（如特征不匹配）时视为最差，让候选模型得以晋升
+            logger.warning(f"当前模型无法评估留出集，按最差处理: {e}")
+            current_score = -np.inf
+        logger.info(f"留出集头马平均对数似然：候选 {candidate_score:.4f}，当前 {current_score:.4f}")
+
+        if current is not None and candidate_score <= current_score:
+            logger.info("候选模型未胜出，保留当前模型。")
+            return False
+
+        version = self.registry.register(candidate, {
+            "holdout_log_likelihood": candidate_score,
+            "previous_log_likelihood": current_score if np.isfinite(current_score) else None
+        }, trained_until=pd.Timestamp(dates[~is_holdout].max()).strftime("%d/%m/%Y"))
+        self.registry.promote(version)
+        self.predictor.swap(candidate)
+        return True
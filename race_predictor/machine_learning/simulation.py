@@ -0,0 +1,138 @@
+import time
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from utils.logger import logger
+from machine_learning.ranking import RACE_KEYS
+
+def build_probability_matrix(df: pd.DataFrame, prob_col: str = "预测概率") -> Dict:
+    """
+    把多场赛事的胜出概率整理成 (场数, 最大出赛马数) 的矩阵，空位为 0，每行归一化为 1。
+    df 可以是多场 predict_winner 结果拼接而成，或 RaceRanker.score_meeting 的输出。
+    """
+    keys = [k for k in RACE_KEYS if k in df.columns]
+    df = df.reset_index(drop=True)
+    race_idx = df.groupby(keys, sort=True).ngroup().to_numpy()
+    slot = df.groupby(race_idx).cumcount().to_numpy()
+    n_races, max_runners = race_idx.max() + 1, slot.max() + 1
+
+    probs = np.zeros((n_races, max_runners))
+    probs[race_idx, slot] = np.clip(df[prob_col].to_numpy(dtype=float), 0, None)
+    totals = probs.sum(axis=1, keepdims=True)
+    probs = np.divide(probs, totals, out=np.zeros_like(probs), where=totals > 0)
+
+    labels = df["馬號"].astype(str).to_numpy() if "馬號" in df.columns else (slot + 1).astype(str)
+    return {"df": df, "keys": keys, "race_idx": race_idx, "slot": slot, "probs": probs, "labels": labels}
+
+def sample_finishing_orders(probs: np.ndarray, n_sims: int, top_k: int = 3,
+                            rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    按 Harville（Plackett-Luce）模型批量抽样所有赛事的前 top_k 名。
+    对 log(p) 加 Gumbel 噪声后取最大的 top_k 个，等价于逐名次按剩余概率抽样。
+    返回形状 (n_sims, 场数, top_k) 的槽位编号。
+    噪声以 float32 原地生成（取负的 key，越小越靠前），每批只占一份 float32 数组的内存。
+    """
+    rng = rng or np.random.default_rng()
+    with np.errstate(divide="ignore"):
+        log_p = np.log(probs).astype(np.float32)
+    # -Gumbel = log(-log(U))；U 下限截到最小正数，避免 log(0)
+    neg_keys = rng.random((n_sims,) + probs.shape, dtype=np.float32)
+    np.maximum(neg_keys, np.finfo(np.float32).tiny, out=neg_keys)
+    np.log(neg_keys, out=neg_keys)
+    np.negative(neg_keys, out=neg_keys)
+    np.log(neg_keys, out=neg_keys)
+    neg_keys -= log_p # 空位 log_p 为 -inf，key 为 +inf，永远排在最后
+    top_k = min(top_k, probs.shape[1])
+    # argpartition 只选出前 top_k，再对这 top_k 个排序，避免整行全排序
+    part = np.argpartition(neg_keys, top_k - 1, axis=-1)[..., :top_k]
+    part_keys = np.take_along_axis(neg_keys, part, axis=-1)
+    order = np.argsort(part_keys, axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+def simulate_meeting(df: pd.DataFrame, n_sims: int = 1_000_000, batch_size: int = 20_000,
+                     prob_col: str = "预测概率", seed: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+    """
+    对一个赛马日的所有赛事做蒙特卡洛模拟，返回:
+      "placing": 每匹马跑第一、二、三名及入三甲（位置）的概率；
+      "quinella": 连赢（前两名不分先后）组合概率；
+      "trio": 单T（前三名不分先后）组合概率。
+    计数全部用 np.bincount 累加，不在 Python 中逐次循环。
+    """
+    m = build_probability_matrix(df, prob_col)
+    probs = m["probs"]
+    n_races, n_slots = probs.shape
+    rng = np.random.default_rng(seed)
+
+    place_counts = np.zeros((3, n_races * n_slots))
+    quinella_counts = np.zeros(n_races * n_slots ** 2)
+    trio_counts = np.zeros(n_races * n_slots ** 3)
+    race_offset = np.arange(n_races)[None, :]
+
+    done = 0
+    while done < n_sims:
+        size = min(batch_size, n_sims - done)
+        top = sample_finishing_orders(probs, size, rng=rng)
+        # 出赛马不足三匹的赛事会抽到空位，空位不计入
+        valid = probs[race_offset[..., None], top] > 0
+        for pos in range(top.shape[-1]):
+            place_counts[pos] += np.bincount((race_offset * n_slots + top[..., pos]).ravel(),
+                                             weights=valid[..., pos].ravel(), minlength=n_races * n_slots)
+        if top.shape[-1] >= 2:
+            a, b = np.sort(top[..., :2], axis=-1).transpose(2, 0, 1)
+            quinella_counts += np.bincount((race_offset * n_slots ** 2 + a * n_slots + b).ravel(),
+                                           weights=valid[..., :2].all(axis=-1).ravel(),
+                                           minlength=quinella_counts.size)
+        if top.shape[-1] >= 3:
+            a, b, c = np.sort(top, axis=-1).transpose(2, 0, 1)
+            trio_counts += np.bincount((race_offset * n_slots ** 3 + (a * n_slots + b) * n_slots + c).ravel(),
+                                       weights=valid.all(axis=-1).ravel(), minlength=trio_counts.size)
+        done += size
+
+    # 每匹马的名次概率
+    flat = m["race_idx"] * n_slots + m["slot"]
+    placing = m["df"][m["keys"] + [c for c in ["馬號", "馬名"] if c in m["df"].columns]].copy()
+    for pos, col in enumerate(["第一名概率", "第二名概率", "第三名概率"]):
+        placing[col] = place_counts[pos][flat] / n_sims
+    placing["位置概率"] = placing[["第一名概率", "第二名概率", "第三名概率"]].sum(axis=1)
+
+    # 组合概率：把计数下标还原为场次与槽位
+    label_of = np.full((n_races, n_slots), "", dtype=object)
+    label_of[m["race_idx"], m["slot"]] = m["labels"]
+    race_keys = m["df"].groupby(m["race_idx"])[m["keys"]].first()
+
+    def combos(counts: np.ndarray, k: int) -> pd.DataFrame:
+        idx = np.flatnonzero(counts)
+        race, rest = np.divmod(idx, n_slots ** k)
+        slots: List[np.ndarray] = []
+        for power in range(k - 1, -1, -1):
+            s, rest = np.divmod(rest, n_slots ** power)
+            slots.append(s)
+        names = [label_of[race, s].astype(str) for s in slots]
+        out = race_keys.iloc[race].reset_index(drop=True)
+        out["組合"] = pd.Series(names[0]).str.cat(names[1:], sep="-")
+        out["概率"] = counts[idx] / n_sims
+        return out.sort_values(m["keys"] + ["概率"], ascending=[True] * len(m["keys"]) + [False]).reset_index(drop=True)
+
+    logger.info(f"完成 {n_sims} 次模拟，共 {n_races} 场赛事。")
+    return {"placing": placing, "quinella": combos(quinella_counts, 2), "trio": combos(trio_counts, 3)}
+
+def benchmark_simulation(n_races: int = 11, n_runners: int = 14, n_sims: int = 1_000_000,
+                         batch_size: int = 20_000, seed: int = 42) -> float:
+    """用随机概率的模拟赛马日测量模拟速度，返回每秒模拟的赛马日数（每次含全部场次）"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for race_no in range(1, n_races + 1):
+        p = rng.dirichlet(np.ones(n_runners))
+        rows += [{"場次": race_no, "馬號": h + 1, "预测概率": p[h]} for h in range(n_runners)]
+    df = pd.DataFrame(rows)
+
+    start = time.perf_counter()
+    simulate_meeting(df, n_sims=n_sims, batch_size=batch_size, seed=seed)
+    elapsed = time.perf_counter() - start
+    rate = n_sims / elapsed
+    logger.info(f"{n_races} 场 x {n_runners} 匹，{n_sims} 次模拟耗时 {elapsed:.2f} 秒，"
+                f"约 {rate:,.0f} 次/秒（{rate * n_races:,.0f} 场次/秒）。")
+    return rate
+
+if __name__ == "__main__":
+    benchmark_simulation()
@@ -0,0 +1,211 @@
+import os
+import sys
+import pickle
+import argparse
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+from utils.logger import logger
+from machine_learning.model import FEATURES
+
+try:
+    import resource # Linux / macOS
+except ImportError:
+    resource = None
+
+# 保存的 CSV 中以 m:ss.ff 格式存储的特征列，读取时需转回秒数
+TIME_FEATURES = ["平均完成时间", "完成時間"]
+# 每行每列估算的内存开销（字节）：float64 本身加上 CSV 解析的临时对象
+BYTES_PER_CELL = 64
+
+def peak_rss_mb() -> Optional[float]:
+    """返回当前进程的峰值常驻内存 (MB)，无法获取时返回 None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+def batch_rows_for_budget(memory_budget_mb: float, n_columns: int) -> int:
+    """按内存预算估算每批读取的行数（预算的一半留给模型和其余开销）"""
+    rows = int(memory_budget_mb * 1024 * 1024 / 2 / (n_columns * BYTES_PER_CELL))
+    return max(rows, 1000)
+
+def _to_seconds(col: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(col):
+        return col
+    return pd.to_timedelta("0:" + col.astype(str), errors="coerce").dt.total_seconds()
+
+def iter_feature_batches(path: str, batch_rows: int, features: List[str] = FEATURES,
+                         holdout_every: int = 5) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    分块读取磁盘上的特征数据集，逐批产出 (X, y, 是否留出)。
+    按全局行号每 holdout_every 行留出一行做评估，不需要把数据整体读入内存。
+    """
+    usecols = set(features) | {"是否第一"}
+    offset = 0
+    for chunk in pd.read_csv(path, usecols=lambda c: c in usecols, chunksize=batch_rows, encoding="utf-8-sig"):
+        # 旧数据集可能没有新增的特征列（如分段时间特征），缺失列按 0 处理
+        chunk = chunk.reindex(columns=list(features) + ["是否第一"])
+        for col in TIME_FEATURES:
+            if col in chunk.columns:
+                chunk[col] = _to_seconds(chunk[col])
+        X = chunk[features].apply(pd.to_numeric, errors="coerce")
+        X = X.replace([np.inf, -np.inf], np.nan).fillna(0).to_numpy(dtype=np.float32)
+        y = chunk["是否第一"].to_numpy(dtype=int)
+        holdout = (np.arange(offset, offset + len(chunk)) % holdout_every) == 0
+        offset += len(chunk)
+        yield X, y, holdout
+
+def _as_float32(X) -> np.ndarray:
+    return np.asarray(X, dtype=np.float32)
+
+class BoosterClassifier(ClassifierMixin, BaseEstimator):
+    """
+    包装 LightGBM Booster，提供与 sklearn 分类器一致的 fit / predict / predict_proba。
+    流式训练直接写入 booster_；fit 用于 clone 后在内存数据上按同样参数重新训练（如 train_ranker 的 base_model）。
+    """
+
+    def __init__(self, params: Optional[dict] = None, num_boost_round: int = 100):
+        self.params = params
+        self.num_boost_round = num_boost_round
+
+    def fit(self, X, y) -> "BoosterClassifier":
+        params = {"objective": "binary", "verbose": -1, "seed": 42, **(self.params or {})}
+        self.booster_ = lgb.train(params, lgb.Dataset(_as_float32(X), np.asarray(y)), num_boost_round=self.num_boost_round)
+        self.classes_ = np.array([0, 1])
+        if isinstance(X, pd.DataFrame):
+            self.feature_names_in_ = np.array(X.columns)
+        return self
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self.booster_.predict(_as_float32(X))
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X) -> np.ndarray:
+        return (self.predict_proba(X)[:, 1] >= 0.5).astype(int)
+
+class ScaledSGDClassifier(ClassifierMixin, BaseEstimator):
+    """标准化 + SGD 逻辑回归，两者都支持 partial_fit；fit 用于 clone 后在内存数据上重新拟合"""
+
+    def __init__(self, random_state: int = 42):
+        self.random_state = random_state
+
+    def _init_parts(self) -> None:
+        self.scaler_ = StandardScaler()
+        self.model_ = SGDClassifier(loss="log_loss", random_state=self.random_state)
+        self.classes_ = np.array([0, 1])
+
+    def fit(self, X, y) -> "ScaledSGDClassifier":
+        self._init_parts()
+        X32 = _as_float32(X)
+        self.model_.fit(self.scaler_.fit_transform(X32), np.asarray(y))
+        if isinstance(X, pd.DataFrame):
+            self.feature_names_in_ = np.array(X.columns)
+        return self
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.model_.predict_proba(self.scaler_.transform(_as_float32(X)))
+
+    def predict(self, X) -> np.ndarray:
+        return self.model_.predict(self.scaler_.transform(_as_float32(X)))
+
+def train_model_streaming(path: str, method: str = "sgd", memory_budget_mb: float = 2048,
+                          epochs: int = 3, rounds_per_batch: int = 20,
+                          model_path: Optional[str] = "models/streaming_model.pkl") -> dict:
+    """
+    在不把完整特征表读入内存的情况下训练模型，适合多个赛季的历史数据。
+    method="sgd"：标准化 + SGD 逻辑回归，逐批 partial_fit，共 epochs 轮；
+    method="lightgbm"：每批在已有 Booster 上继续提升 rounds_per_batch 轮。
+    每批行数由 memory_budget_mb 决定，训练结束报告峰值内存。
+    返回的模型是 sklearn 估计器（可 clone），可作为 train_ranker 的 base_model。
+    """
+    if method not in ("sgd", "lightgbm"):
+        raise ValueError(f"不支持的流式训练方法: {method}")
+
+    batch_rows = batch_rows_for_budget(memory_budget_mb, len(FEATURES) + 1)
+    logger.info(f"流式训练 ({method}) 开始：内存预算 {memory_budget_mb} MB，每批 {batch_rows} 行。")
+
+    def batches():
+        return iter_feature_batches(path, batch_rows)
+
+    if method == "sgd":
+        model = ScaledSGDClassifier()
+        model._init_parts()
+        model.feature_names_in_ = np.array(FEATURES) # 与 sklearn 模型一样记录训练特征
+        # 第一遍只拟合标准化参数
+        for X, y, holdout in batches():
+            model.scaler_.partial_fit(X[~holdout])
+        for epoch in range(epochs):
+            for X, y, holdout in batches():
+                if (~holdout).any():
+                    model.model_.partial_fit(model.scaler_.transform(X[~holdout]), y[~holdout], classes=[0, 1])
+            logger.info(f"第 {epoch + 1}/{epochs} 轮完成。")
+    else:
+        params = {"objective": "binary", "verbose": -1, "seed": 42}
+        booster = None
+        for X, y, holdout in batches():
+            train_set = lgb.Dataset(X[~holdout], y[~holdout], free_raw_data=True)
+            booster = lgb.train(params, train_set, num_boost_round=rounds_per_batch,
+                                init_model=booster, keep_training_booster=True)
+        if booster is None:
+            raise ValueError(f"数据集 {path} 为空，无法训练。")
+        # 记录总提升轮数，clone 后 fit 会按同样的参数与轮数重新训练
+        model = BoosterClassifier(params, num_boost_round=booster.current_iteration())
+        model.booster_ = booster
+        model.classes_ = np.array([0, 1])
+        model.feature_names_in_ = np.array(FEATURES)
+
+    # 最后一遍在留出行上评估，只累计计数
+    correct = total = rows = 0
+    for X, y, holdout in batches():
+        rows += len(y)
+        if holdout.any():
+            correct += int((model.predict(X[holdout]) == y[holdout]).sum())
+            total += int(holdout.sum())
+    accuracy = correct / total if total else 0.0
+
+    peak = peak_rss_mb()
+    if peak is not None:
+        logger.info(f"流式训练完成：{rows} 行，留出集准确率 {accuracy:.4f}，峰值内存 {peak:.1f} MB。")
+        if peak > memory_budget_mb:
+            logger.warning(f"峰值内存 {peak:.1f} MB 超出预算 {memory_budget_mb} MB。")
+    else:
+        logger.info(f"流式训练完成：{rows} 行，留出集准确率 {accuracy:.4f}（无法获取峰值内存）。")
+
+    if model_path:
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        with open(model_path, "wb") as f:
+            pickle.dump(model, f)
+        logger.info(f"流式训练模型已保存到 {model_path}")
+
+    return {
+        "model": model,
+        "accuracy": accuracy,
+        "rows": rows,
+        "peak_rss_mb": peak
+    }
+
+if __name__ == "__main__":
+    # 例：python -m machine_learning.streaming ../data/processed_data_v2.csv --method lightgbm --memory-budget-mb 512
+    parser = argparse.ArgumentParser(description="在磁盘上的特征数据集上做内存受限的流式训练")
+    parser.add_argument("path", help="add_historical_features 输出的特征 CSV")
+    parser.add_argument("--method", choices=["sgd", "lightgbm"], default="sgd")
+    parser.add_argument("--memory-budget-mb", type=float, default=2048)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--rounds-per-batch", type=int, default=20)
+    parser.add_argument("--model-path", default="models/streaming_model.pkl")
+    args = parser.parse_args()
+    # 通过包路径调用，pickle 记录的模型类才是 machine_learning.streaming.* 而不是 __main__.*
+    from machine_learning.streaming import train_model_streaming as train
+    train(args.path, method=args.method, memory_budget_mb=args.memory_budget_mb,
+          epochs=args.epochs, rounds_per_batch=args.rounds_per_batch, model_path=args.model_path)
@@ -3,12 +3,17 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import pandas as pd
 from scraper.fetcher import scrape_race_day_parallel, fetch_race_schedule
+from scraper.page_cache import PageCache
 from data_processing.preprocessing import preprocess_data
 from data_processing.feature_engineering import add_historical_features
+from data_processing.result_index import ResultIndex, upsert_results
 from machine_learning.model import train_model
-from machine_learning.predictor import predict_winner
+from machine_learning.ranking import train_ranker
+from machine_learning.registry import ModelRegistry
+from machine_learning.scheduler import HotSwapPredictor, RetrainScheduler
 from utils.session import create_session
-from utils.logger import logger
+from utils.logger import logger, configure_event_log
+from utils.metrics import metrics
 import math
 
 def seconds_to_mmssff(seconds):
@@ -32,7 +37,11 @@ def seconds_to_mmssff(seconds):
     return f"{minutes}:{formatted_seconds_str}"
 
 if __name__ == "__main__":
+    # 结构化事件与汇总指标只在运行主流程时写入 logs/
+    configure_event_log("logs/events.jsonl")
+    metrics.path = "logs/metrics.json"
     session = create_session()
+    page_cache = PageCache("data/page_cache")
 
     # 指定你想查的日期與場地 (使用dd/mm/yyyy格式)
     racing_days = [
@@ -42,21 +51,50 @@ if __name__ == "__main__":
     ]
     
     combined_results = []
+    changed_races = [] # 页面内容有变更的 (日期, 馬場, 場次)；全部未变更时跳过后续处理
     for date_str, venue in racing_days:
         logger.info(f"===== 开始抓取 {date_str} {venue} =====")
-        day_races = scrape_race_day_parallel(session, date_str, venue)
+        day_races = scrape_race_day_parallel(session, date_str, venue, cache=page_cache)
         if not day_races:
             logger.info(f"{date_str} {venue} 无数据，跳过。")
             continue
 
         for race_info in day_races:
+            if race_info.get("內容已變更"):
+                info = race_info.get("基本資訊", {})
+                changed_races.append((info.get("日期"), info.get("馬場"), info.get("場次")))
             base_info = race_info.get("基本資訊", {})
             results = race_info.get("賽果", [])
             for row in results:
                 combined_results.append({**base_info, **row})
     
+    logger.info(f"本次抓取内容有变更的场次: {len(changed_races)}")
+
     # 進行後續資料處理 & 建模
-    df = pd.DataFrame(combined_results)
+    scraped_df = pd.DataFrame(combined_results)
+
+    # 原始赛果按 (日期, 馬場, 場次, 馬匹編號) 累积保存，索引与之一同保存：
+    # 索引 O(1) 挑出新增/更正的行并 upsert，重叠的 racing_days 或重跑不会重复计入历史特征
+    results_csv_path = "data/race_results.csv"
+    result_index = ResultIndex.for_dataset(results_csv_path)
+    existing_df = pd.read_csv(results_csv_path, dtype=str, encoding="utf-8-sig") if os.path.exists(results_csv_path) else pd.DataFrame()
+    known_meetings = set(result_index.meetings)
+    ingested_df = result_index.ingest(scraped_df)
+    new_meetings = set(result_index.meetings) - known_meetings
+
+    # 没有场次页面变更、也没有新增/更正的赛果时，数据集、特征与模型都与上次运行相同，
+    # 跳过预处理、特征重建、CSV 重写与重训
+    if not changed_races and ingested_df.empty and os.path.exists("data/processed_data_v2.csv"):
+        logger.info("所有场次内容均未变更，跳过后续处理与重训。")
+        sys.exit(0)
+
+    df = upsert_results(existing_df, ingested_df)
+    os.makedirs("data", exist_ok=True)
+    df.to_csv(results_csv_path, index=False, encoding="utf-8-sig")
+    result_index.save()
+    logger.info(f"原始赛果共 {len(df)} 行，已保存到 {results_csv_path}")
+    if not scraped_df.empty:
+        result_index.verify(meetings=list(scraped_df[["日期", "馬場"]].drop_duplicates().itertuples(index=False, name=None)))
     
     # --- 添加排序邏輯 ---
     # 轉換日期為可排序格式，並確保場次是數值類型
@@ -136,17 +174,35 @@ if __name__ == "__main__":
     # --- 保存结束 ---
 
     # --- 模型训练和预测（使用 df_for_model，包含秒数）---
-    logger.info("开始模型训练（使用秒数格式的时间数据）...")
-    # 训练模型并获取比较结果 - 传入包含秒数的 df_for_model
-    model_result = train_model(df_for_model) 
-    best_model = model_result["best_model"]
-    best_acc = model_result["best_accuracy"]
-    model_results = model_result["model_results"]
-    
-    logger.info("\n===== 模型比较结果 =====")
-    for name, acc in model_results.items():
-        logger.info(f"{name}: {acc:.4f}")
-    logger.info(f"最佳模型准确率: {best_acc:.4f}")
+    # 已有上线模型时直接用它预测，新赛马日交给后台调度器重训、评估并热切换
+    registry = ModelRegistry(best_model_path="models/ranker.pkl")
+    predictor = HotSwapPredictor(registry.load())
+    scheduler = RetrainScheduler(predictor, registry).start()
+
+    if predictor.ranker is None:
+        logger.info("没有可用的已训练模型，开始模型训练（使用秒数格式的时间数据）...")
+        # 训练模型并获取比较结果 - 传入包含秒数的 df_for_model
+        model_result = train_model(df_for_model) 
+        best_model = model_result["best_model"]
+        best_acc = model_result["best_accuracy"]
+        model_results = model_result["model_results"]
+        
+        logger.info("\n===== 模型比较结果 =====")
+        for name, acc in model_results.items():
+            logger.info(f"{name}: {acc:.4f}")
+        logger.info(f"最佳模型准确率: {best_acc:.4f}")
+
+        # 以最佳模型的参数拟合按场归一化的排名模型（条件 logit，温度在留出赛事上校准）
+        ranker = train_ranker(df_for_model, base_model=best_model, model_path=None)
+        # 记录训练数据截止日期，之后的重训只用此后的赛马日评估该模型
+        trained_until = pd.to_datetime(df_for_model["日期"], format="%d/%m/%Y").max().strftime("%d/%m/%Y")
+        registry.promote(registry.register(ranker, {"best_accuracy": best_acc}, trained_until=trained_until))
+        predictor.swap(ranker)
+    elif new_meetings:
+        logger.info(f"使用已上线的排名模型预测，新增赛马日 {sorted(new_meetings)}，后台重训开始。")
+        scheduler.notify_race_day_ingested(df_for_model)
+    else:
+        logger.info("使用已上线的排名模型预测，没有新增赛马日，不重训。")
     
     # 調試日期與數據過濾
     logger.info("開始檢查可用日期與數據：")
@@ -169,14 +225,14 @@ if prediction_date:
         race_numbers = sorted(prediction_df['場次'].unique())
         logger.info(f"找到 {prediction_date} 的場次: {race_numbers}")
 
+        # 整個賽馬日一次打分，同場概率和為 1
+        meeting_predictions = predictor.score_meeting(prediction_df)
+
         for race_no in race_numbers:
             logger.info(f"--- 預測第 {race_no} 場 ---")
             try:
-                # 獲取該場次的數據
-                sample_race = prediction_df.groupby("場次").get_group(race_no).copy()
-                
-                # 進行預測，獲取帶概率的 DataFrame
-                race_predictions = predict_winner(sample_race, best_model) 
+                # 獲取該場次的預測結果
+                race_predictions = meeting_predictions[meeting_predictions["場次"] == race_no].reset_index(drop=True)
                 
                 # 打印預測結果
                 if not race_predictions.empty:
@@ -186,7 +242,7 @@ if prediction_date:
                     # 打印所有馬匹的預測概率
                     logger.info(f"第 {race_no} 場預測概率詳情:")
                     # 使用 to_string() 避免截斷
-                    print(race_predictions[['馬名', '预测概率']].to_string(index=False)) 
+                    print(race_predictions[['馬名', '预测概率', '隐含概率', '期望值']].to_string(index=False)) 
                 else:
                      logger.warning(f"第 {race_no} 場預測結果為空。")
 
@@ -197,3 +253,7 @@ if prediction_date:
 else:
     logger.error("數據集中沒有可用的日期進行預測。")
 # --- 預測結束 ---
+
+# 等待後台重訓完成，確保勝出的候選模型已晉升並保存
+scheduler.stop()
+
@@ -1,23 +1,77 @@
 import re
+import time
 from typing import List, Optional, Union, Dict, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import requests
 from bs4 import BeautifulSoup
 # 使用簡單相對導入
 from utils.session import create_session
-from utils.logger import logger
+from utils.logger import logger, log_event, EVENT_SAMPLE_RATE
+from utils.metrics import metrics
 from scraper.parser import parse_basic_info, parse_results
+from scraper.page_cache import PageCache
+
+def _timed_get(session: requests.Session, url: str, timeout: int, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    """发送 GET 并记录请求数、字节数、重试次数与延迟；逐 URL 事件按 EVENT_SAMPLE_RATE 采样记录"""
+    logger.debug(f"请求 URL: {url}")
+    start = time.perf_counter()
+    try:
+        response = session.get(url, timeout=timeout, headers=headers)
+    except requests.RequestException:
+        metrics.incr("http_errors")
+        raise
+    finally:
+        metrics.incr("http_requests")
+        metrics.observe("http_latency_seconds", time.perf_counter() - start)
+    retries = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+    metrics.incr("http_bytes", len(response.content))
+    metrics.incr("http_retries", len(retries))
+    metrics.incr(f"http_status_{response.status_code}")
+    log_event("http_request", sample_rate=EVENT_SAMPLE_RATE, url=url, status=response.status_code,
+              bytes=len(response.content), retries=len(retries),
+              latency_ms=round(response.elapsed.total_seconds() * 1000, 1))
+    return response
 
 def fetch_page(session: requests.Session, url: str, timeout: int = 15) -> Optional[str]:
-    logger.info(f"请求 URL: {url}")
     try:
-        response = session.get(url, timeout=timeout)
+        response = _timed_get(session, url, timeout)
         response.raise_for_status()
         return response.text
     except requests.RequestException as e:
         logger.error(f"请求错误：{e}")
     return None
 
+def fetch_page_conditional(session: requests.Session, url: str, cache: PageCache, timeout: int = 15) -> Tuple[Optional[str], bool]:
+    """
+    发送带 If-None-Match / If-Modified-Since 的条件请求。
+    返回 (页面内容, 是否变更)；304 或内容哈希未变时视为未变更，页面内容取自缓存。
+    """
+    entry = cache.get(url) or {}
+    try:
+        response = _timed_get(session, url, timeout, cache.conditional_headers(url))
+        if response.status_code == 304 and entry.get("body") is not None:
+            logger.debug(f"{url} 未修改 (304)，使用缓存。")
+            return entry["body"], False
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"请求错误：{e}")
+        return None, False
+
+    html = response.text
+    content_hash = PageCache.content_hash(html)
+    changed = content_hash != entry.get("content_hash")
+    new_entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": content_hash,
+        "body": html,
+    }
+    # 内容未变时保留之前的解析结果，变更时丢弃
+    if not changed and "parsed" in entry:
+        new_entry["parsed"] = entry["parsed"]
+    cache.put(url, new_entry)
+    return html, changed
+
 def fetch_race_schedule(session: requests.Session, num_days: int = 3) -> List[Tuple[str, str]]:
     """
     從 HKJC 的賽馬排期頁面，抓取最近賽馬日期與場地 (簡化示例).
@@ -47,28 +101,63 @@ def fetch_race_schedule(session: requests.Session, num_days: int = 3) -> List[Tu
 
     return date_venue_list[:num_days]
 
-def scrape_single_race(session: requests.Session, date_str: str, venue: str, race_no: int) -> Dict[str, Union[Dict[str, str], List[Dict[str, str]]]]:
+def _cached_race(entry: Optional[Dict]) -> Optional[Dict]:
+    """从缓存条目取出解析结果，并标记为未变更"""
+    if not entry or "parsed" not in entry:
+        return None
+    parsed = entry["parsed"]
+    return {**parsed, "內容已變更": False} if parsed else {}
+
+def scrape_single_race(session: requests.Session, date_str: str, venue: str, race_no: int,
+                       cache: Optional[PageCache] = None) -> Dict[str, Union[Dict[str, str], List[Dict[str, str]], bool]]:
+    """
+    抓取并解析单场赛果。传入 cache 时使用条件请求，内容未变则直接返回缓存的解析结果；
+    返回值中的 "內容已變更" 标记该场是否需要重新处理。
+    """
     base_url = "https://racing.hkjc.com/racing/information/Chinese/Racing/LocalResults.aspx"
     target_url = f"{base_url}?RaceDate={date_str}&Racecourse={venue}&RaceNo={race_no}"
-    
-    html = fetch_page(session, target_url)
+
+    if cache is not None:
+        # 已定案的赛事有缓存就不再请求
+        if cache.is_settled(date_str):
+            cached = _cached_race(cache.get(target_url))
+            if cached is not None:
+                return cached
+        html, changed = fetch_page_conditional(session, target_url, cache)
+        if html and not changed:
+            cached = _cached_race(cache.get(target_url))
+            if cached is not None:
+                logger.debug(f"{date_str} {venue} 第 {race_no} 场内容未变，跳过解析。")
+                metrics.incr("pages_unchanged")
+                return cached
+    else:
+        html = fetch_page(session, target_url)
     if not html:
         return {}
     
-    soup = BeautifulSoup(html, "html.parser")
-    basic_info = parse_basic_info(soup)
-    results_data = parse_results(soup)
+    with metrics.timer("parse_seconds"):
+        soup = BeautifulSoup(html, "html.parser")
+        basic_info = parse_basic_info(soup)
+        results_data = parse_results(soup)
+    metrics.incr("pages_parsed")
+    race = {"基本資訊": basic_info, "賽果": results_data} if results_data else {}
+
+    if cache is not None:
+        entry = cache.get(target_url) or {}
+        cache.put(target_url, {**entry, "parsed": race})
     
     if not results_data:
-        logger.info(f"{date_str} {venue} 第 {race_no} 场无赛果数据，跳过。")
+        logger.debug(f"{date_str} {venue} 第 {race_no} 场无赛果数据，跳过。")
         return {}
     
-    logger.info(f"{date_str} {venue} 第 {race_no} 场 解析到 {len(results_data)} 条赛果数据。")
-    return {"基本資訊": basic_info, "賽果": results_data}
+    logger.debug(f"{date_str} {venue} 第 {race_no} 场 解析到 {len(results_data)} 条赛果数据。")
+    metrics.incr("result_rows_parsed", len(results_data))
+    return {**race, "內容已變更": True}
 
-def scrape_race_day_parallel(session: requests.Session, date_str: str, venue: str, max_races: int = 11) -> List[Dict]:
+def scrape_race_day_parallel(session: requests.Session, date_str: str, venue: str, max_races: int = 11,
+                             cache: Optional[PageCache] = None) -> List[Dict]:
     def scrape_race(race_no):
-        return scrape_single_race(session, date_str, venue, race_no)
+        return scrape_single_race(session, date_str, venue, race_no, cache)
     
     with ThreadPoolExecutor(max_workers=5) as executor:
         results = list(executor.map(scrape_race, range(1, max_races + 1)))
@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+# 使用絕對導入
+from utils.logger import logger
+
+class PageCache:
+    """
+    按 URL 保存响应校验信息（ETag / Last-Modified）、内容哈希及解析结果的磁盘缓存。
+    每个 URL 对应一个 JSON 文件，写入时先写临时文件再替换，多线程抓取下也不会写坏。
+    """
+
+    def __init__(self, cache_dir: str = "data/page_cache", settle_days: int = 1):
+        self.cache_dir = cache_dir
+        # 赛事日期距今超过 settle_days 天视为结果已定案，不再请求网络
+        self.settle_days = settle_days
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """计算页面内容的 SHA-256 哈希"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, url: str) -> Optional[Dict]:
+        """读取 URL 的缓存条目，不存在或损坏时返回 None"""
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取缓存 {path} 失败: {e}")
+            return None
+
+    def put(self, url: str, entry: Dict) -> None:
+        """写入（覆盖）URL 的缓存条目"""
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({**entry, "url": url}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """根据已保存的校验信息构造条件请求头"""
+        entry = self.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_settled(self, date_str: str) -> bool:
+        """
+        判断赛事结果是否已定案。赛马日当天（及 settle_days 天内）派彩和赛果可能更正，
+        需要重新验证；更早的赛事直接使用缓存。date_str 为 dd/mm/yyyy 或 yyyy/mm/dd。
+        """
+        for fmt in ("%d/%m/%Y", "%Y/%m/%d"):
+            try:
+                race_date = datetime.strptime(date_str, fmt).date()
+                break
+            except ValueError:
+                continue
+        else:
+            return False
+        return race_date < datetime.now().date() - timedelta(days=self.settle_days)
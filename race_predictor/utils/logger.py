@@ -1,14 +1,80 @@
+import os
 import sys
+import json
+import queue
+import atexit
+import random
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # 重新配置 stdout，避免乱码
-sys.stdout.reconfigure(encoding='utf-8')
+if hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding='utf-8')
 
-# 配置日志
-handler = logging.StreamHandler(sys.stdout)
+# 结构化事件（JSON Lines）输出位置；导入时只在设置了该环境变量时写文件，
+# 否则由入口脚本（main.py）调用 configure_event_log() 开启
+EVENT_LOG_PATH = os.environ.get("RACE_PREDICTOR_EVENT_LOG", "")
+# 事件文件轮转：单个文件上限与保留的旧文件数
+EVENT_LOG_MAX_BYTES = 10 * 1024 * 1024
+EVENT_LOG_BACKUP_COUNT = 5
+# 高频事件（如每个 URL 请求）的采样率
+EVENT_SAMPLE_RATE = float(os.environ.get("RACE_PREDICTOR_EVENT_SAMPLE_RATE", "0.01"))
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为一行 JSON，log_event 传入的字段放在顶层"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        event.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+# 配置日志：调用方只把记录放入队列，格式化与 I/O 由后台 QueueListener 线程完成
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setLevel(logging.INFO)
+console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+# 结构化事件只写入 JSON 文件，不刷屏
+console_handler.addFilter(lambda record: not hasattr(record, "fields"))
+
+log_queue: queue.Queue = queue.Queue(-1)
+listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop) # 退出时把队列中剩余的记录写完
+
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s')) # 入队时只合并消息参数，完整格式由输出 handler 决定
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[handler]
+    handlers=[queue_handler]
 )
-logger = logging.getLogger("HKJC_Scraper")
\ No newline at end of file
+logger = logging.getLogger("HKJC_Scraper")
+
+def configure_event_log(path: str = "logs/events.jsonl", max_bytes: int = EVENT_LOG_MAX_BYTES,
+                        backup_count: int = EVENT_LOG_BACKUP_COUNT) -> None:
+    """
+    开启结构化事件文件（JSON Lines，按大小轮转）。只写入 log_event 产生的事件，
+    普通日志仍只输出到控制台。
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    event_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    event_handler.setFormatter(JsonFormatter())
+    event_handler.addFilter(lambda record: hasattr(record, "fields"))
+    # QueueListener 线程每条记录都读取 handlers，整体替换元组即可生效
+    listener.handlers = listener.handlers + (event_handler,)
+
+if EVENT_LOG_PATH:
+    configure_event_log(EVENT_LOG_PATH)
+
+def log_event(event: str, level: int = logging.INFO, sample_rate: float = 1.0, **fields) -> None:
+    """记录结构化事件（只写入 configure_event_log 开启的事件文件）；sample_rate < 1 时按比例采样，用于每个请求级别的高频事件"""
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": {"event": event, **fields}})
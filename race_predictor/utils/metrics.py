@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from utils.logger import logger, log_event
+
+# 汇总指标在退出时写入的位置；默认只写日志，入口脚本可设置 metrics.path 写入文件
+METRICS_PATH = os.environ.get("RACE_PREDICTOR_METRICS", "")
+# 延迟直方图的桶上界（秒），最后一个桶收集所有更大的值
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+class Histogram:
+    """固定分桶的直方图，记录次数、总和、最大值"""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + [self.max], self.counts):
+            seen += n
+            if seen >= target and n:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+class Metrics:
+    """线程安全的计数器与直方图集合；热路径上只做加锁后的内存累加"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.path = METRICS_PATH
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """计时上下文，耗时（秒）记入名为 name 的直方图"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()},
+            }
+
+    def dump(self, path: Optional[str] = None) -> None:
+        """把汇总指标写入日志（结构化事件）及 JSON 文件（path 默认 self.path，为空则不写文件）"""
+        path = self.path if path is None else path
+        snap = self.snapshot()
+        if not snap["counters"] and not snap["histograms"]:
+            return
+        log_event("metrics_summary", **snap)
+        for name, value in sorted(snap["counters"].items()):
+            logger.info(f"[指标] {name}: {value:g}")
+        for name, h in sorted(snap["histograms"].items()):
+            logger.info(f"[指标] {name}: {h['count']} 次，均值 {h['mean'] * 1000:.1f} ms，"
+                        f"p95 {h['p95'] * 1000:.1f} ms，最大 {h['max'] * 1000:.1f} ms")
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(snap, f, ensure_ascii=False, indent=2)
+
+metrics = Metrics()
+# 在 logger 的 QueueListener 停止之前执行（atexit 后注册先执行）
+atexit.register(metrics.dump)